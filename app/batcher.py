@@ -0,0 +1,72 @@
+"""
+Small async micro-batcher.
+Collects items for up to max_wait seconds (or max_batch_size items) and hands
+them to the handler in one go, so per-item costs like broker round-trips are
+paid once per batch.
+"""
+import asyncio
+from typing import Any, Awaitable, Callable, List, Optional
+import logging
+
+logger = logging.getLogger(__name__)
+
+_STOP = object()
+
+
+class Batcher:
+    def __init__(
+        self,
+        handler: Callable[[List[Any]], Awaitable[None]],
+        max_batch_size: int = 100,
+        max_wait: float = 0.05
+    ):
+        self.handler = handler
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._task: Optional[asyncio.Task] = None
+
+    def start(self):
+        """Start the background loop - call from inside the running event loop"""
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self):
+        """Flush whatever is queued and stop the background loop"""
+        if self._task is None:
+            return
+        self._queue.put_nowait(_STOP)
+        await self._task
+        self._task = None
+
+    def submit(self, item: Any):
+        self._queue.put_nowait(item)
+
+    async def _run(self):
+        loop = asyncio.get_running_loop()
+        stopping = False
+
+        while not stopping:
+            first = await self._queue.get()
+            if first is _STOP:
+                break
+
+            batch = [first]
+            deadline = loop.time() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    item = await asyncio.wait_for(self._queue.get(), timeout)
+                except asyncio.TimeoutError:
+                    break
+                if item is _STOP:
+                    stopping = True
+                    break
+                batch.append(item)
+
+            try:
+                await self.handler(batch)
+            except Exception as e:
+                # keep the loop alive, one bad batch shouldn't stop the rest
+                logger.error(f"Error handling batch of {len(batch)} items: {str(e)}")
@@ -1,20 +1,60 @@
+"""
+Celery app setup.
+
+Worker pool, concurrency and prefetch come from settings so the same image can
+be tuned per deployment:
+- prefork + long blocking tasks: keep CELERY_PREFETCH_MULTIPLIER=1 so a busy
+  process doesn't sit on tasks other processes could be running
+- threads/gevent/eventlet with short or I/O-bound tasks: use 4 or more so the
+  pool always has work buffered
+
+Start prefork workers with -Ofair so tasks only go to processes that are free.
+"""
 from celery import Celery
+from kombu.serialization import register
+import orjson
 from app.config import settings
 
+# orjson is a lot faster than the stdlib json celery uses by default
+register(
+    "orjson",
+    orjson.dumps,
+    orjson.loads,
+    content_type="application/x-orjson",
+    content_encoding="utf-8"
+)
+
 celery_app = Celery(
     "payment_processor",
-    broker=settings.redis_url,
-    backend=settings.redis_url
+    # separate urls so a slow result backend can't hold up enqueueing
+    broker=settings.redis_url_broker or settings.redis_url,
+    backend=settings.redis_url_backend or settings.redis_url,
+    include=["app.tasks"]
 )
 
 # celery configuration
 celery_app.conf.update(
-    task_serializer="json",
-    accept_content=["json"],
-    result_serializer="json",
+    task_serializer="orjson",
+    accept_content=["orjson", "json"],  # json so messages already queued still run
+    result_serializer="orjson",
     timezone="UTC",
     enable_utc=True,
     task_track_started=True,
     task_acks_late=True,  # acknowledge task after it completes
-    worker_prefetch_multiplier=1,  # fetch one task at a time
+    task_acks_on_failure_or_timeout=True,
+    task_reject_on_worker_lost=True,  # requeue if the worker dies mid-task
+    broker_pool_limit=settings.celery_broker_pool_limit,
+    broker_transport_options={
+        "max_connections": settings.celery_broker_max_connections,
+        "socket_keepalive": True,
+    },
+    worker_pool=settings.celery_pool,
+    worker_concurrency=settings.celery_concurrency,
+    worker_prefetch_multiplier=settings.celery_prefetch_multiplier,
+    beat_schedule={
+        "requeue-stale-transactions": {
+            "task": "requeue_stale_transactions",
+            "schedule": settings.stale_requeue_interval,
+        },
+    },
 )
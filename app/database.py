@@ -1,23 +1,46 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
+from sqlalchemy.engine import make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from app.config import settings
 
-engine = create_engine(settings.database_url, pool_pre_ping=True)
+# async engine for the API - lets the event loop multiplex requests over the pool
+async_engine = create_async_engine(settings.database_url, pool_pre_ping=True)
+AsyncSessionLocal = async_sessionmaker(
+    bind=async_engine,
+    class_=AsyncSession,
+    autoflush=False,
+    expire_on_commit=False
+)
+
+# sync engine for the celery worker, same database but through psycopg2.
+# one connection per worker thread so tasks never queue on the pool
+sync_database_url = make_url(settings.database_url).set(drivername="postgresql+psycopg2")
+engine = create_engine(
+    sync_database_url,
+    pool_pre_ping=True,
+    pool_size=settings.celery_concurrency,
+    max_overflow=0
+)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
+# any fixed number works, it just has to be the same in every process
+INIT_DB_LOCK_ID = 7_240_315
+
 
-def get_db():
-    """Dependency to get DB session"""
-    db = SessionLocal()
-    try:
+async def get_db():
+    """Dependency to get an async DB session"""
+    async with AsyncSessionLocal() as db:
         yield db
-    finally:
-        db.close()
 
 
-def init_db():
+async def init_db():
     """Create all tables in the database"""
-    Base.metadata.create_all(bind=engine)
+    async with async_engine.begin() as conn:
+        # every uvicorn worker runs this at startup - serialize them so only the
+        # first one creates the schema and the rest see it already exists
+        await conn.execute(text("SELECT pg_advisory_xact_lock(:lock_id)"), {"lock_id": INIT_DB_LOCK_ID})
+        await conn.run_sync(Base.metadata.create_all)
@@ -1,18 +1,29 @@
-from fastapi import FastAPI, Depends, HTTPException, status
-from sqlalchemy.orm import Session
-from sqlalchemy.exc import IntegrityError
+from fastapi import FastAPI, Depends, HTTPException, Request, status
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import ORJSONResponse
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from pydantic import TypeAdapter, ValidationError
 from datetime import datetime
+from typing import List, Tuple
+import asyncio
 import logging
+import orjson
+import redis.asyncio as aioredis
+from redis.exceptions import RedisError
 
-from app.database import get_db, init_db
+from app.batcher import Batcher
+from app.config import settings
+from app.database import AsyncSessionLocal, get_db, init_db
 from app.models import Transaction, TransactionStatus
 from app.schemas import (
     WebhookRequest,
-    WebhookResponse,
     HealthCheckResponse,
     TransactionResponse
 )
-from app.tasks import process_transaction
+from app.tasks import process_transaction_batch
+from app.worker import InProcessWorker
 
 # setup logging
 logging.basicConfig(level=logging.INFO)
@@ -22,15 +33,108 @@ logger = logging.getLogger(__name__)
 app = FastAPI(
     title="Payment Webhook Processing Service",
     description="Service to receive and process payment transaction webhooks",
-    version="1.0.0"
+    version="1.0.0",
+    default_response_class=ORJSONResponse
+)
+
+
+# replayed webhooks are caught here with one SET NX before they ever reach postgres.
+# single-node mode runs without redis, postgres alone dedupes there
+redis_client = None if settings.use_inprocess_worker else aioredis.Redis.from_url(
+    settings.redis_url,
+    max_connections=settings.redis_max_connections
+)
+
+# single-node deployments can skip celery entirely
+inprocess_worker = (
+    InProcessWorker(settings.inprocess_workers) if settings.use_inprocess_worker else None
+)
+
+
+async def publish_transactions(transaction_ids: List[str]):
+    if inprocess_worker is not None:
+        inprocess_worker.submit(transaction_ids)
+        return
+
+    # one celery message for the whole batch instead of one per webhook.
+    # .delay() talks to redis synchronously so keep it off the event loop
+    await asyncio.to_thread(process_transaction_batch.delay, transaction_ids)
+    logger.info(f"Queued batch of {len(transaction_ids)} transactions for processing")
+
+
+async def ingest_webhooks(batch: List[Tuple[dict, asyncio.Future]]):
+    """
+    Insert a batch of webhooks with a single multi-row INSERT ... ON CONFLICT DO NOTHING,
+    queue the new ones, then let each waiting request know whether its transaction was new.
+    """
+    # the same id can show up twice in one batch - only the first one goes in the insert
+    rows = {}
+    for values, _ in batch:
+        rows.setdefault(values["transaction_id"], values)
+
+    try:
+        async with AsyncSessionLocal() as db:
+            stmt = pg_insert(Transaction).values(
+                list(rows.values())
+            ).on_conflict_do_nothing(
+                index_elements=["transaction_id"]
+            ).returning(Transaction.transaction_id)
+
+            inserted = set((await db.execute(stmt)).scalars().all())
+            await db.commit()
+    except Exception as e:
+        for _, future in batch:
+            if not future.done():
+                future.set_exception(e)
+        raise
+
+    accepted = [transaction_id for transaction_id in rows if transaction_id in inserted]
+    if accepted:
+        try:
+            await publish_transactions(accepted)
+        except Exception as e:
+            # rows are committed but not queued - fail the requests instead of answering 202,
+            # the stale requeue task picks the rows up later
+            for _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            raise
+
+    # answer the waiting requests - a repeat of a new id in the same batch is still a duplicate
+    answered = set()
+    for values, future in batch:
+        transaction_id = values["transaction_id"]
+        if not future.done():
+            future.set_result(transaction_id in inserted and transaction_id not in answered)
+        answered.add(transaction_id)
+
+
+webhook_batcher = Batcher(
+    ingest_webhooks,
+    max_batch_size=settings.dispatch_batch_size,
+    max_wait=settings.dispatch_batch_wait
 )
 
 
 @app.on_event("startup")
 async def startup_event():
     # initialize the database tables when app starts
-    init_db()
+    await init_db()
     logger.info("Database initialized")
+    if inprocess_worker is not None:
+        await inprocess_worker.start()
+        logger.info(f"Started {settings.inprocess_workers} in-process workers")
+    webhook_batcher.start()
+
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    # make sure anything still buffered gets queued before we exit
+    await webhook_batcher.stop()
+    if inprocess_worker is not None:
+        await inprocess_worker.stop()
+    if redis_client is not None:
+        await redis_client.aclose()
 
 
 @app.get("/", response_model=HealthCheckResponse)
@@ -42,93 +146,155 @@ async def health_check():
     )
 
 
-@app.post(
-    "/v1/webhooks/transactions",
-    response_model=WebhookResponse,
-    status_code=status.HTTP_202_ACCEPTED
-)
-async def receive_webhook(
-    webhook: WebhookRequest,
-    db: Session = Depends(get_db)
-):
+# built once at import so every request reuses the same compiled validator
+WEBHOOK_ADAPTER = TypeAdapter(WebhookRequest)
+
+
+def _body_errors(e: ValidationError, body: bytes) -> list:
+    """Same 422 error shape fastapi gives for a normal body parameter"""
+    errors = []
+    for error in e.errors(include_url=False):
+        if error["type"] == "json_invalid":
+            # fastapi reports where the json broke and never echoes the raw body back
+            try:
+                orjson.loads(body)
+                position = 0
+            except orjson.JSONDecodeError as decode_error:
+                position = decode_error.pos
+            errors.append({
+                "type": "json_invalid",
+                "loc": ("body", position),
+                "msg": "JSON decode error",
+                "input": {},
+                "ctx": {"error": error.get("ctx", {}).get("error", "")}
+            })
+            continue
+        if not error["loc"]:
+            # input here is the whole body, don't send it back
+            error.pop("input", None)
+        errors.append({**error, "loc": ("body", *error["loc"])})
+    return errors
+
+
+def _webhook_response(message: str, transaction_id: str) -> ORJSONResponse:
+    # same body as WebhookResponse, built directly
+    return ORJSONResponse(
+        {"message": message, "transaction_id": transaction_id},
+        status_code=status.HTTP_202_ACCEPTED
+    )
+
+
+async def receive_webhook(request: Request):
     """
     Main webhook endpoint - receives transaction webhooks and queues them for processing.
     Returns 202 immediately to meet the <500ms requirement.
+
+    This is the hottest route so it's a plain starlette endpoint - no dependency
+    injection or response_model serialization, just validate, batch and respond.
     """
+    # validate the raw bytes straight into the model - skips the json -> dict step
+    body = await request.body()
     try:
-        # first check if we've already seen this transaction (idempotency check)
-        existing_transaction = db.query(Transaction).filter(
-            Transaction.transaction_id == webhook.transaction_id
-        ).first()
-        
-        if existing_transaction:
+        webhook = WEBHOOK_ADAPTER.validate_json(body)
+    except ValidationError as e:
+        raise RequestValidationError(_body_errors(e, body))
+
+    # cheap duplicate check in redis first - postgres still has the final say.
+    # the key is "pending" while some request is inserting the row and "done" once
+    # it's committed; only "done" is trusted to answer without touching postgres
+    idempotency_key = f"idem:{webhook.transaction_id}"
+    owns_claim = False
+    if redis_client is not None:
+        try:
+            # short claim until the row is committed, so a crash before the insert
+            # doesn't turn a day of sender retries into "already received"
+            previous = await redis_client.set(
+                idempotency_key, "pending", nx=True, ex=settings.idempotency_claim_ttl, get=True
+            )
+            owns_claim = previous is None
+            if previous == b"done":
+                logger.info(f"Duplicate webhook received for transaction: {webhook.transaction_id}")
+                return _webhook_response("Transaction already received", webhook.transaction_id)
+        except RedisError as e:
+            logger.warning(f"Idempotency cache unavailable, falling back to database: {str(e)}")
+
+    try:
+        # hand the row to the batcher, which inserts it together with other
+        # webhooks arriving in the same few milliseconds and tells us if it was new
+        future = asyncio.get_running_loop().create_future()
+        webhook_batcher.submit(({
+            "transaction_id": webhook.transaction_id,
+            "source_account": webhook.source_account,
+            "destination_account": webhook.destination_account,
+            "amount": webhook.amount,
+            "currency": webhook.currency,
+            "status": TransactionStatus.PROCESSING
+        }, future))
+
+        is_new = await future
+
+        # the row is in the database now, remember it for the full ttl
+        if redis_client is not None:
+            try:
+                await redis_client.set(idempotency_key, "done", ex=settings.idempotency_ttl)
+            except RedisError as e:
+                logger.warning(f"Could not mark idempotency key done: {str(e)}")
+
+        if not is_new:
             # already got this one, just return success
             logger.info(f"Duplicate webhook received for transaction: {webhook.transaction_id}")
-            return WebhookResponse(
-                message="Transaction already received",
-                transaction_id=webhook.transaction_id
-            )
-        
-        # create new transaction in the database
-        new_transaction = Transaction(
-            transaction_id=webhook.transaction_id,
-            source_account=webhook.source_account,
-            destination_account=webhook.destination_account,
-            amount=webhook.amount,
-            currency=webhook.currency,
-            status=TransactionStatus.PROCESSING
-        )
-        
-        db.add(new_transaction)
-        db.commit()
-        db.refresh(new_transaction)
-        
-        # queue it up for background processing with celery
-        process_transaction.delay(webhook.transaction_id)
+            return _webhook_response("Transaction already received", webhook.transaction_id)
         
         logger.info(f"Webhook accepted for transaction: {webhook.transaction_id}")
         
-        return WebhookResponse(
-            message="Transaction accepted for processing",
-            transaction_id=webhook.transaction_id
-        )
-        
-    except IntegrityError:
-        # race condition - another request inserted the same transaction between our check and insert
-        # this is fine, just rollback and return success
-        db.rollback()
-        logger.info(f"Race condition handled for transaction: {webhook.transaction_id}")
-        return WebhookResponse(
-            message="Transaction already received",
-            transaction_id=webhook.transaction_id
-        )
+        return _webhook_response("Transaction accepted for processing", webhook.transaction_id)
         
     except Exception as e:
-        db.rollback()
         logger.error(f"Error processing webhook: {str(e)}")
+        # the row never made it in, so let the sender's retry through
+        if owns_claim:
+            try:
+                await redis_client.delete(idempotency_key)
+            except RedisError:
+                pass
         raise HTTPException(
             status_code=status.HTTP_500_INTERNAL_SERVER_ERROR,
             detail="Internal server error"
         )
 
 
+# registered as a raw route (responses match WebhookResponse), so it isn't in /docs
+app.add_route("/v1/webhooks/transactions", receive_webhook, methods=["POST"])
+
+
 @app.get(
     "/v1/transactions/{transaction_id}",
     response_model=TransactionResponse
 )
 async def get_transaction(
     transaction_id: str,
-    db: Session = Depends(get_db)
+    db: AsyncSession = Depends(get_db)
 ):
     """Get transaction status by ID - useful for testing and monitoring"""
-    transaction = db.query(Transaction).filter(
-        Transaction.transaction_id == transaction_id
-    ).first()
+    # plain column select - no ORM object to build for a read-only lookup
+    result = await db.execute(
+        select(
+            Transaction.transaction_id,
+            Transaction.source_account,
+            Transaction.destination_account,
+            Transaction.amount,
+            Transaction.currency,
+            Transaction.status,
+            Transaction.created_at,
+            Transaction.processed_at
+        ).where(Transaction.transaction_id == transaction_id)
+    )
+    row = result.one_or_none()
     
-    if not transaction:
+    if row is None:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND,
             detail=f"Transaction {transaction_id} not found"
         )
     
-    return transaction
+    return TransactionResponse(**row._mapping)
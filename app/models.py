@@ -1,10 +1,15 @@
-from sqlalchemy import Column, String, Float, DateTime, Enum as SQLEnum
+from sqlalchemy import Column, String, Numeric, DateTime, Index, and_, event, or_, select, text, update, Enum as SQLEnum
 from sqlalchemy.sql import func
-from datetime import datetime
+from datetime import datetime, timedelta
 import enum
 from app.database import Base
 
 
+# transactions is hash partitioned on transaction_id so each partition's primary
+# key index stays small and vacuum works on one partition at a time
+TRANSACTION_PARTITIONS = 8
+
+
 class TransactionStatus(str, enum.Enum):
     PROCESSING = "PROCESSING"
     PROCESSED = "PROCESSED"
@@ -13,15 +18,95 @@ class TransactionStatus(str, enum.Enum):
 
 class Transaction(Base):
     __tablename__ = "transactions"
+    __table_args__ = (
+        # small partial index - only the in-flight rows, for monitoring and requeueing
+        Index(
+            "ix_tx_status_processing",
+            "status",
+            postgresql_where=text("status = 'PROCESSING'")
+        ),
+        # webhooks arrive roughly in time order so a BRIN index stays tiny
+        Index("ix_tx_created_brin", "created_at", postgresql_using="brin"),
+        {"postgresql_partition_by": "HASH (transaction_id)"},
+    )
 
-    transaction_id = Column(String, primary_key=True, index=True)
+    transaction_id = Column(String, primary_key=True)  # primary key is already indexed
     source_account = Column(String, nullable=False)
     destination_account = Column(String, nullable=False)
-    amount = Column(Float, nullable=False)
+    amount = Column(Numeric(18, 4), nullable=False)
     currency = Column(String, nullable=False)
     status = Column(SQLEnum(TransactionStatus), default=TransactionStatus.PROCESSING, nullable=False)
     created_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)
     processed_at = Column(DateTime(timezone=True), nullable=True)  # null until processed
+    queued_at = Column(DateTime(timezone=True), server_default=func.now(), nullable=False)  # last (re)queued
+    claimed_at = Column(DateTime(timezone=True), nullable=True)  # set while a worker is on it
 
     def __repr__(self):
         return f"<Transaction {self.transaction_id} - {self.status}>"
+
+
+def claim_transaction(transaction_id: str, lease_seconds: float):
+    """
+    UPDATE that claims a PROCESSING row for one worker, returning the payment payload
+    columns - no row back means it's finished already or someone else holds the claim.
+    A claim older than lease_seconds is treated as abandoned (worker died).
+    """
+    return (
+        update(Transaction)
+        .where(
+            Transaction.transaction_id == transaction_id,
+            Transaction.status == TransactionStatus.PROCESSING,
+            or_(
+                Transaction.claimed_at.is_(None),
+                Transaction.claimed_at < func.now() - timedelta(seconds=lease_seconds)
+            )
+        )
+        .values(claimed_at=func.now())
+        .returning(
+            Transaction.transaction_id,
+            Transaction.source_account,
+            Transaction.destination_account,
+            Transaction.amount,
+            Transaction.currency
+        )
+    )
+
+
+def requeue_stale(stale_after: float, lease_seconds: float, limit: int):
+    """
+    UPDATE that picks PROCESSING rows which look lost - unclaimed and queued more than
+    stale_after seconds ago, or with a claim older than lease_seconds - bumps their
+    queued_at, clears the claim and returns their ids. SKIP LOCKED so concurrent
+    sweeps split the rows instead of both taking them.
+    """
+    stale = (
+        select(Transaction.transaction_id)
+        .where(
+            Transaction.status == TransactionStatus.PROCESSING,
+            or_(
+                and_(
+                    Transaction.claimed_at.is_(None),
+                    Transaction.queued_at < func.now() - timedelta(seconds=stale_after)
+                ),
+                Transaction.claimed_at < func.now() - timedelta(seconds=lease_seconds)
+            )
+        )
+        .limit(limit)
+        .with_for_update(skip_locked=True)
+    )
+    return (
+        update(Transaction)
+        .where(Transaction.transaction_id.in_(stale.scalar_subquery()))
+        .values(queued_at=func.now(), claimed_at=None)
+        .returning(Transaction.transaction_id)
+    )
+
+
+@event.listens_for(Transaction.__table__, "after_create")
+def create_transaction_partitions(target, connection, **kw):
+    # create_all only makes the parent table, the partitions have to be added by hand
+    for remainder in range(TRANSACTION_PARTITIONS):
+        connection.execute(text(
+            f"CREATE TABLE IF NOT EXISTS transactions_p{remainder} PARTITION OF transactions "
+            f"FOR VALUES WITH (MODULUS {TRANSACTION_PARTITIONS}, REMAINDER {remainder})"
+        ))
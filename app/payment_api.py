@@ -0,0 +1,185 @@
+"""
+Client for the external payment API.
+Calls run on one background event loop per process so lots of tasks can wait
+on the API at the same time without each one holding a worker process.
+"""
+import asyncio
+import threading
+import time
+from email.utils import parsedate_to_datetime
+from datetime import datetime, timezone
+from typing import Dict, Optional
+from urllib.parse import urlparse
+
+import aiohttp
+import orjson
+
+from app.config import settings
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class PaymentAPIError(Exception):
+    """Payment API rejected the request - retrying won't help"""
+
+
+class RetryablePaymentAPIError(PaymentAPIError):
+    """Rate limited, server error or network problem - safe to retry later"""
+
+    def __init__(self, message: str, retry_after: Optional[float] = None):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def _parse_retry_after(value: Optional[str]) -> Optional[float]:
+    """
+    Delay in seconds from a Retry-After / X-RateLimit-Reset header. Handles plain
+    seconds, unix epoch timestamps (anything past the current time) and HTTP dates,
+    capped at payment_api_max_retry_after so a bad header can't stall us for long.
+    """
+    if not value:
+        return None
+    try:
+        delay = float(value)
+        if delay > time.time():
+            # an absolute reset time rather than a number of seconds
+            delay -= time.time()
+    except ValueError:
+        try:
+            retry_at = parsedate_to_datetime(value)
+        except (TypeError, ValueError):
+            return None
+        delay = (retry_at - datetime.now(timezone.utc)).total_seconds()
+    return min(max(delay, 0.0), settings.payment_api_max_retry_after)
+
+
+class RateLimiter:
+    """
+    Token bucket limiter for outbound calls.
+    Also backs off everyone when the API tells us to slow down via headers.
+    """
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+        self._blocked_until = 0.0
+
+    async def acquire(self):
+        while True:
+            now = time.monotonic()
+            if now < self._blocked_until:
+                await asyncio.sleep(self._blocked_until - now)
+                continue
+
+            self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+            self._updated_at = now
+            if self._tokens >= 1:
+                self._tokens -= 1
+                return
+
+            await asyncio.sleep((1 - self._tokens) / self.rate)
+
+    def update_from_headers(self, headers) -> Optional[float]:
+        """Pause the bucket if the response says we're out of quota"""
+        delay = _parse_retry_after(headers.get("Retry-After"))
+        if delay is None and headers.get("X-RateLimit-Remaining") == "0":
+            delay = _parse_retry_after(headers.get("X-RateLimit-Reset"))
+        if delay:
+            self._blocked_until = max(self._blocked_until, time.monotonic() + delay)
+        return delay
+
+
+# one session per process so TCP/TLS connections to the API get reused
+_session: Optional[aiohttp.ClientSession] = None
+_semaphores: Dict[str, asyncio.Semaphore] = {}
+_rate_limiter = RateLimiter(
+    rate=settings.payment_api_rate_limit,
+    capacity=settings.payment_api_rate_limit
+)
+
+
+def _host_semaphore(url: str) -> asyncio.Semaphore:
+    host = urlparse(url).netloc
+    if host not in _semaphores:
+        _semaphores[host] = asyncio.Semaphore(settings.payment_api_max_concurrency_per_host)
+    return _semaphores[host]
+
+
+def transaction_payload(transaction) -> dict:
+    """Request body for the payment API"""
+    return {
+        "transaction_id": transaction.transaction_id,
+        "source_account": transaction.source_account,
+        "destination_account": transaction.destination_account,
+        "amount": str(transaction.amount),  # decimal as a string so no precision is lost
+        "currency": transaction.currency
+    }
+
+
+async def get_session() -> aiohttp.ClientSession:
+    """Shared client session - must be used from the loop it was created on"""
+    global _session
+    if _session is None or _session.closed:
+        _session = aiohttp.ClientSession(
+            connector=aiohttp.TCPConnector(
+                limit=settings.payment_api_max_connections,
+                limit_per_host=settings.payment_api_max_concurrency_per_host,
+                keepalive_timeout=60
+            ),
+            timeout=aiohttp.ClientTimeout(total=settings.payment_api_timeout),
+            json_serialize=lambda obj: orjson.dumps(obj).decode()
+        )
+    return _session
+
+
+async def close_session():
+    global _session
+    if _session is not None:
+        await _session.close()
+        _session = None
+
+
+async def submit_payment(payload: dict):
+    """Send a transaction to the payment API, raising PaymentAPIError on failure"""
+    if not settings.payment_api_url:
+        # no real API configured - simulate the slow external call
+        await asyncio.sleep(settings.payment_api_simulated_delay)
+        return
+
+    url = settings.payment_api_url
+    async with _host_semaphore(url):
+        await _rate_limiter.acquire()
+        session = await get_session()
+        try:
+            async with session.post(url, json=payload) as response:
+                retry_after = _rate_limiter.update_from_headers(response.headers)
+                if response.status == 429 or response.status >= 500:
+                    raise RetryablePaymentAPIError(
+                        f"Payment API returned {response.status}",
+                        retry_after=retry_after
+                    )
+                if response.status >= 400:
+                    raise PaymentAPIError(f"Payment API returned {response.status}")
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            raise RetryablePaymentAPIError(f"Payment API request failed: {str(e)}") from e
+
+
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_loop_lock = threading.Lock()
+
+
+def _get_loop() -> asyncio.AbstractEventLoop:
+    global _loop
+    with _loop_lock:
+        if _loop is None:
+            _loop = asyncio.new_event_loop()
+            threading.Thread(target=_loop.run_forever, name="payment-api-loop", daemon=True).start()
+    return _loop
+
+
+def run(coro):
+    """Run a coroutine on the shared background loop and wait for the result (for sync callers)"""
+    return asyncio.run_coroutine_threadsafe(coro, _get_loop()).result()
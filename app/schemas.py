@@ -1,5 +1,6 @@
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, ConfigDict, Field
 from datetime import datetime
+from decimal import Decimal
 from typing import Optional
 from app.models import TransactionStatus
 
@@ -8,19 +9,13 @@ class WebhookRequest(BaseModel):
     transaction_id: str = Field(..., description="Unique transaction identifier")
     source_account: str = Field(..., description="Source account identifier")
     destination_account: str = Field(..., description="Destination account identifier")
-    amount: float = Field(..., gt=0, description="Transaction amount")
+    amount: Decimal = Field(..., gt=0, max_digits=18, decimal_places=4, description="Transaction amount")
     currency: str = Field(..., description="Currency code (e.g., INR, USD)")
 
-    class Config:
-        json_schema_extra = {
-            "example": {
-                "transaction_id": "txn_abc123def456",
-                "source_account": "acc_user_789",
-                "destination_account": "acc_merchant_456",
-                "amount": 1500,
-                "currency": "INR"
-            }
-        }
+    model_config = ConfigDict(
+        extra="ignore",
+        str_max_length=128  # reject silly long ids/accounts before they get near the DB
+    )
 
 
 class WebhookResponse(BaseModel):
@@ -37,11 +32,10 @@ class TransactionResponse(BaseModel):
     transaction_id: str
     source_account: str
     destination_account: str
-    amount: float
+    amount: Decimal
     currency: str
     status: TransactionStatus
     created_at: datetime
     processed_at: Optional[datetime] = None
 
-    class Config:
-        from_attributes = True  # for SQLAlchemy compatibility
+    model_config = ConfigDict(from_attributes=True)  # for SQLAlchemy compatibility
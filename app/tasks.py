@@ -1,59 +1,156 @@
-import time
-from datetime import datetime
+from datetime import datetime, timedelta
+from typing import List
+from celery import group
+from celery.signals import worker_process_init, worker_process_shutdown
 from sqlalchemy.orm import Session
+from app import payment_api
 from app.celery_app import celery_app
+from app.config import settings
 from app.database import SessionLocal
-from app.models import Transaction, TransactionStatus
+from app.models import Transaction, TransactionStatus, claim_transaction, requeue_stale
 import logging
 
 logger = logging.getLogger(__name__)
 
 
+@worker_process_init.connect
+def init_payment_api_session(**kwargs):
+    # open the shared HTTP session once per worker process instead of per task
+    payment_api.run(payment_api.get_session())
+
+
+@worker_process_shutdown.connect
+def close_payment_api_session(**kwargs):
+    payment_api.run(payment_api.close_session())
+
+
+def _set_status(transaction_id: str, status: TransactionStatus):
+    # short session of its own - never hold a connection across the API call
+    db: Session = SessionLocal()
+    try:
+        db.query(Transaction).filter(
+            Transaction.transaction_id == transaction_id
+        ).update({"status": status, "processed_at": datetime.utcnow()})
+        db.commit()
+    except Exception as update_error:
+        db.rollback()
+        logger.error(f"Failed to update transaction status: {str(update_error)}")
+        raise
+    finally:
+        db.close()
+
+
+def _mark_failed(transaction_id: str):
+    # mark it as failed so we know something went wrong
+    try:
+        _set_status(transaction_id, TransactionStatus.FAILED)
+    except Exception:
+        pass
+
+
+def _release_claim(transaction_id: str):
+    # let the retry (or a requeued copy) claim the row again
+    db: Session = SessionLocal()
+    try:
+        db.query(Transaction).filter(
+            Transaction.transaction_id == transaction_id
+        ).update({"claimed_at": None})
+        db.commit()
+    except Exception as update_error:
+        db.rollback()
+        logger.error(f"Failed to release claim on transaction {transaction_id}: {str(update_error)}")
+    finally:
+        db.close()
+
+
+def _retry_or_fail(task, transaction_id: str, exc: Exception, countdown: float):
+    if task.request.retries >= task.max_retries:
+        _mark_failed(transaction_id)
+        raise exc
+    _release_claim(transaction_id)
+    raise task.retry(exc=exc, countdown=countdown)
+
+
 @celery_app.task(name="process_transaction", bind=True, max_retries=3)
 def process_transaction(self, transaction_id: str):
     """
     Background task to process a transaction.
-    Includes a 30 second sleep to simulate external API calls.
+    Sends it to the external payment API (or simulates the 30 second call).
     """
-    db: Session = SessionLocal()
-    
     try:
         logger.info(f"Starting processing for transaction: {transaction_id}")
         
-        # simulate calling external payment API - takes 30 seconds
-        time.sleep(30)
+        # claim the row so duplicate deliveries of this task can't pay twice,
+        # and give the connection back before the long wait
+        db: Session = SessionLocal()
+        try:
+            row = db.execute(
+                claim_transaction(transaction_id, settings.transaction_claim_lease)
+            ).first()
+            db.commit()
+        finally:
+            db.close()
         
-        # update the transaction status
-        transaction = db.query(Transaction).filter(
-            Transaction.transaction_id == transaction_id
-        ).first()
+        if row is None:
+            logger.info(f"Transaction {transaction_id} already processed or claimed, skipping")
+            return
         
-        if transaction:
-            transaction.status = TransactionStatus.PROCESSED
-            transaction.processed_at = datetime.utcnow()
-            db.commit()
-            logger.info(f"Successfully processed transaction: {transaction_id}")
-        else:
-            logger.error(f"Transaction not found: {transaction_id}")
+        # call the external payment API - the wait happens on the shared event
+        # loop so this worker thread isn't burning a process while it waits
+        payment_api.run(payment_api.submit_payment(payment_api.transaction_payload(row)))
+        
+        # update the transaction status
+        _set_status(transaction_id, TransactionStatus.PROCESSED)
+        logger.info(f"Successfully processed transaction: {transaction_id}")
+    
+    except payment_api.RetryablePaymentAPIError as e:
+        # rate limited or the API is having trouble - back off and try again
+        logger.warning(f"Payment API unavailable for transaction {transaction_id}: {str(e)}")
+        countdown = e.retry_after if e.retry_after is not None else 2 ** self.request.retries
+        _retry_or_fail(self, transaction_id, e, countdown)
+    
+    except payment_api.PaymentAPIError as e:
+        # the API rejected the payment, retrying won't change that
+        logger.error(f"Payment API rejected transaction {transaction_id}: {str(e)}")
+        _mark_failed(transaction_id)
             
     except Exception as e:
         logger.error(f"Error processing transaction {transaction_id}: {str(e)}")
-        db.rollback()
-        
-        # mark it as failed so we know something went wrong
-        try:
-            transaction = db.query(Transaction).filter(
-                Transaction.transaction_id == transaction_id
-            ).first()
-            if transaction:
-                transaction.status = TransactionStatus.FAILED
-                transaction.processed_at = datetime.utcnow()
-                db.commit()
-        except Exception as update_error:
-            logger.error(f"Failed to update transaction status: {str(update_error)}")
-            
         # retry the task after a minute
-        raise self.retry(exc=e, countdown=60)
-        
+        _retry_or_fail(self, transaction_id, e, 60)
+
+
+@celery_app.task(name="process_transaction_batch")
+def process_transaction_batch(transaction_ids: List[str]):
+    """
+    Fan a batch of transactions from the webhook endpoint out to
+    process_transaction so each one still retries on its own.
+    """
+    logger.info(f"Received batch of {len(transaction_ids)} transactions")
+    group(process_transaction.s(transaction_id) for transaction_id in transaction_ids).apply_async()
+
+
+@celery_app.task(name="requeue_stale_transactions")
+def requeue_stale_transactions():
+    """
+    Periodic safety net - requeue PROCESSING transactions that look lost: queued long
+    ago and never claimed (e.g. the API committed the row but couldn't publish), or
+    claimed by a worker that went away without finishing. Rows that are just waiting
+    behind a backlog get a duplicate task at most once per window, and the claim in
+    process_transaction makes that duplicate a no-op.
+    """
+    db: Session = SessionLocal()
+    try:
+        # bumps queued_at so the same rows aren't requeued again on the next run
+        stale_ids = db.execute(requeue_stale(
+            settings.stale_transaction_after,
+            settings.transaction_claim_lease,
+            settings.stale_requeue_batch_size
+        )).scalars().all()
+        db.commit()
     finally:
         db.close()
+
+    if stale_ids:
+        logger.warning(f"Requeueing {len(stale_ids)} stale transactions")
+        group(process_transaction.s(transaction_id) for transaction_id in stale_ids).apply_async()
@@ -0,0 +1,124 @@
+"""
+In-process alternative to the Celery worker for single-node deployments.
+Transactions are processed by asyncio tasks inside the API process, which skips
+the Redis hop and task envelope per webhook. Durability comes from the row
+already being committed as PROCESSING - anything unfinished when the process
+stops is picked up again on the next startup or by the periodic sweep, and the
+row claim keeps several API processes from paying the same transaction twice.
+"""
+import asyncio
+from datetime import datetime
+from typing import List, Optional
+from sqlalchemy import update
+from app import payment_api
+from app.config import settings
+from app.database import AsyncSessionLocal
+from app.models import Transaction, TransactionStatus, claim_transaction, requeue_stale
+import logging
+
+logger = logging.getLogger(__name__)
+
+
+class InProcessWorker:
+    def __init__(self, concurrency: int, max_retries: int = 3):
+        self.concurrency = concurrency
+        self.max_retries = max_retries
+        self._queue: asyncio.Queue = asyncio.Queue()
+        self._tasks: List[asyncio.Task] = []
+
+    async def start(self):
+        """Requeue anything left PROCESSING and start the worker tasks"""
+        await payment_api.get_session()
+        # on startup take every unclaimed row straight away - another API process may
+        # get some of the same ids, but the row claim in _process lets only one pay
+        await self._requeue_stale(stale_after=0)
+
+        self._tasks = [asyncio.create_task(self._run()) for _ in range(self.concurrency)]
+        self._tasks.append(asyncio.create_task(self._sweep()))
+
+    async def stop(self):
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        await payment_api.close_session()
+
+    async def _requeue_stale(self, stale_after: float):
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(requeue_stale(
+                stale_after,
+                settings.transaction_claim_lease,
+                settings.stale_requeue_batch_size
+            ))
+            stale_ids = result.scalars().all()
+            await db.commit()
+        if stale_ids:
+            logger.info(f"Requeueing {len(stale_ids)} unfinished transactions")
+            self.submit(stale_ids)
+
+    async def _sweep(self):
+        # same job celery beat does in celery mode - pick up rows whose worker died
+        while True:
+            await asyncio.sleep(settings.stale_requeue_interval)
+            try:
+                await self._requeue_stale(settings.stale_transaction_after)
+            except Exception as e:
+                logger.error(f"Error requeueing stale transactions: {str(e)}")
+
+    def submit(self, transaction_ids: List[str]):
+        for transaction_id in transaction_ids:
+            self._queue.put_nowait(transaction_id)
+
+    async def _run(self):
+        while True:
+            transaction_id = await self._queue.get()
+            try:
+                await self._process(transaction_id)
+            except Exception as e:
+                logger.error(f"Error processing transaction {transaction_id}: {str(e)}")
+                await self._set_status(transaction_id, TransactionStatus.FAILED)
+            finally:
+                self._queue.task_done()
+
+    async def _process(self, transaction_id: str):
+        logger.info(f"Starting processing for transaction: {transaction_id}")
+
+        # claim the row first so the same id queued twice (or in two processes) pays once
+        async with AsyncSessionLocal() as db:
+            row = (await db.execute(
+                claim_transaction(transaction_id, settings.transaction_claim_lease)
+            )).first()
+            await db.commit()
+        if row is None:
+            logger.info(f"Transaction {transaction_id} already processed or claimed, skipping")
+            return
+
+        payload = payment_api.transaction_payload(row)
+        retries = 0
+        while True:
+            try:
+                await payment_api.submit_payment(payload)
+                break
+            except payment_api.RetryablePaymentAPIError as e:
+                if retries >= self.max_retries:
+                    raise
+                # same backoff as the celery task
+                countdown = e.retry_after if e.retry_after is not None else 2 ** retries
+                logger.warning(f"Payment API unavailable for transaction {transaction_id}: {str(e)}")
+                retries += 1
+                await asyncio.sleep(countdown)
+
+        await self._set_status(transaction_id, TransactionStatus.PROCESSED)
+        logger.info(f"Successfully processed transaction: {transaction_id}")
+
+    async def _set_status(self, transaction_id: str, status: TransactionStatus):
+        try:
+            async with AsyncSessionLocal() as db:
+                await db.execute(
+                    update(Transaction)
+                    .where(Transaction.transaction_id == transaction_id)
+                    .values(status=status, processed_at=datetime.utcnow())
+                )
+                await db.commit()
+        except Exception as update_error:
+            logger.error(f"Failed to update transaction status: {str(update_error)}")
@@ -3,12 +3,22 @@ Quick test script for manual webhook testing.
 Just sends a webhook and polls for status changes.
 """
 import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
 import time
 import sys
 
 
 BASE_URL = "http://localhost:8000"
 
+# one session for everything so connections get reused instead of reconnecting per request
+SESSION = requests.Session()
+SESSION.mount("http://", HTTPAdapter(
+    pool_connections=50,
+    pool_maxsize=50,
+    max_retries=Retry(total=3, backoff_factor=0.1)
+))
+
 
 def send_test_webhook(transaction_id=None):
     """Send a test webhook"""
@@ -27,7 +37,7 @@ def send_test_webhook(transaction_id=None):
     print(f"Payload: {payload}\n")
     
     try:
-        response = requests.post(f"{BASE_URL}/v1/webhooks/transactions", json=payload)
+        response = SESSION.post(f"{BASE_URL}/v1/webhooks/transactions", json=payload)
         print(f"✅ Response Status: {response.status_code}")
         print(f"Response Body: {response.json()}\n")
         
@@ -46,7 +56,7 @@ def send_test_webhook(transaction_id=None):
 def check_status(transaction_id):
     """Check transaction status"""
     try:
-        response = requests.get(f"{BASE_URL}/v1/transactions/{transaction_id}")
+        response = SESSION.get(f"{BASE_URL}/v1/transactions/{transaction_id}")
         if response.status_code == 200:
             return response.json()
         else:
@@ -0,0 +1,35 @@
+from logging.config import fileConfig
+from alembic import context
+from app.database import Base, engine, sync_database_url
+from app import models  # noqa: F401 - registers the tables on Base
+
+config = context.config
+if config.config_file_name is not None:
+    fileConfig(config.config_file_name)
+
+target_metadata = Base.metadata
+
+
+def run_migrations_offline():
+    """Emit the SQL without connecting (alembic upgrade --sql)"""
+    context.configure(
+        url=sync_database_url.render_as_string(hide_password=False),
+        target_metadata=target_metadata,
+        literal_binds=True
+    )
+    with context.begin_transaction():
+        context.run_migrations()
+
+
+def run_migrations_online():
+    # migrations use the sync psycopg2 engine, same as the celery worker
+    with engine.connect() as connection:
+        context.configure(connection=connection, target_metadata=target_metadata)
+        with context.begin_transaction():
+            context.run_migrations()
+
+
+if context.is_offline_mode():
+    run_migrations_offline()
+else:
+    run_migrations_online()
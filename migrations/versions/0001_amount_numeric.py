@@ -0,0 +1,36 @@
+"""store transaction amount as numeric(18,4)
+
+Revision ID: 0001
+Revises:
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0001"
+down_revision = None
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.alter_column(
+        "transactions",
+        "amount",
+        type_=sa.Numeric(18, 4),
+        existing_type=sa.Float(),
+        existing_nullable=False,
+        postgresql_using="amount::numeric(18,4)"
+    )
+
+
+def downgrade():
+    op.alter_column(
+        "transactions",
+        "amount",
+        type_=sa.Float(),
+        existing_type=sa.Numeric(18, 4),
+        existing_nullable=False,
+        postgresql_using="amount::double precision"
+    )
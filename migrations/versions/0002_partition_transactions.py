@@ -0,0 +1,55 @@
+"""hash partition transactions on transaction_id
+
+Revision ID: 0002
+Revises: 0001
+Create Date: 2026-10-15
+"""
+from alembic import op
+
+
+revision = "0002"
+down_revision = "0001"
+branch_labels = None
+depends_on = None
+
+PARTITIONS = 8
+
+
+def _move_into(create_table_sql):
+    # rename the old table out of the way, create the new one and copy the rows over
+    op.execute("ALTER TABLE transactions RENAME TO transactions_old")
+    op.execute("ALTER TABLE transactions_old RENAME CONSTRAINT transactions_pkey TO transactions_old_pkey")
+    op.execute("DROP INDEX IF EXISTS ix_transactions_transaction_id")
+    op.execute("DROP INDEX IF EXISTS ix_tx_status_processing")
+    op.execute("DROP INDEX IF EXISTS ix_tx_created_brin")
+
+    op.execute(create_table_sql)
+    op.execute("ALTER TABLE transactions ADD CONSTRAINT transactions_pkey PRIMARY KEY (transaction_id)")
+    op.execute(
+        "CREATE INDEX ix_tx_status_processing ON transactions (status) "
+        "WHERE status = 'PROCESSING'"
+    )
+    op.execute("CREATE INDEX ix_tx_created_brin ON transactions USING brin (created_at)")
+
+
+def _copy_and_drop_old():
+    op.execute("INSERT INTO transactions SELECT * FROM transactions_old")
+    op.execute("DROP TABLE transactions_old")
+
+
+def upgrade():
+    _move_into(
+        "CREATE TABLE transactions (LIKE transactions_old INCLUDING DEFAULTS) "
+        "PARTITION BY HASH (transaction_id)"
+    )
+    for remainder in range(PARTITIONS):
+        op.execute(
+            f"CREATE TABLE transactions_p{remainder} PARTITION OF transactions "
+            f"FOR VALUES WITH (MODULUS {PARTITIONS}, REMAINDER {remainder})"
+        )
+    _copy_and_drop_old()
+
+
+def downgrade():
+    _move_into("CREATE TABLE transactions (LIKE transactions_old INCLUDING DEFAULTS)")
+    _copy_and_drop_old()
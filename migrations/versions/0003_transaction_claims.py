@@ -0,0 +1,27 @@
+"""track when transactions were queued and claimed by a worker
+
+Revision ID: 0003
+Revises: 0002
+Create Date: 2026-10-15
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+revision = "0003"
+down_revision = "0002"
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.add_column(
+        "transactions",
+        sa.Column("queued_at", sa.DateTime(timezone=True), server_default=sa.func.now(), nullable=False)
+    )
+    op.add_column("transactions", sa.Column("claimed_at", sa.DateTime(timezone=True), nullable=True))
+
+
+def downgrade():
+    op.drop_column("transactions", "claimed_at")
+    op.drop_column("transactions", "queued_at")